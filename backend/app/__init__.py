@@ -1,18 +1,86 @@
-import json
+import atexit
+import importlib
 import logging
-from datetime import datetime
+import queue
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
 
+import orjson
 from flask import Flask
+from flask.json.provider import JSONProvider
+from flask.logging import default_handler
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+# autoflush buys nothing for an append-only history table but costs an
+# identity-map sweep before every query; expire_on_commit would re-SELECT
+# rows the moment anything touches them after commit.
+db = SQLAlchemy(session_options={"autoflush": False, "expire_on_commit": False})
+
+# Applied to every new sqlite connection of a file-backed database. WAL
+# turns each commit into an append plus one fsync instead of a rollback-
+# journal rewrite with two, and lets /history reads proceed concurrently
+# with compare-path writes; NORMAL synchronous is durable under WAL for
+# everything short of power loss. busy_timeout retries instead of raising
+# "database is locked", and the negative cache_size is 64 MiB of page cache.
+# temp_store keeps sort/aggregate scratch in RAM, and mmap_size (256 MiB)
+# lets page reads come straight off the mapped file without a kernel copy.
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def _configure_sqlite_engine(app: Flask) -> None:
+    """Attach the per-connection PRAGMA hook to this app's engine when it is
+    a file-backed sqlite database (the pragmas are no-ops for :memory:)."""
+    with app.app_context():
+        engine = db.engine
+    if engine.url.drivername != "sqlite":
+        return
+    if engine.url.database in (None, "", ":memory:"):
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:  # noqa: ANN001
+        cursor = dbapi_connection.cursor()
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+# Imported once per process, after db exists: repeated create_app calls
+# (the pytest fixtures in particular) must not re-walk these modules.
+from . import models  # noqa: E402,F401 - registers model metadata
+from .history_writer import start_history_writer  # noqa: E402
+from .routes import api_blueprint  # noqa: E402
+from .services import MarketplaceScraper, PriceComparisonService  # noqa: E402
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson-backed app.json. The hot endpoints serialize directly, but
+    anything still going through jsonify/get_json (error handlers, future
+    views, test helpers) gets the C serializer too."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS, default=str).decode()
 
-db = SQLAlchemy()
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
 
 
 class JsonFormatter(logging.Formatter):
-    def format(self, record: logging.LogRecord) -> str:
+    def format(self, record: logging.LogRecord) -> bytes:
+        # Reuse the timestamp logging already captured and let orjson render
+        # it as RFC3339 in C instead of isoformat() + concat per record.
         payload = {
-            "timestamp": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -21,22 +89,86 @@ class JsonFormatter(logging.Formatter):
             payload["context"] = record.context
         if record.exc_info:
             payload["exception"] = self.formatException(record.exc_info)
-        return json.dumps(payload)
+        elif record.exc_text:
+            # Queue-relayed records carry pre-rendered exception text.
+            payload["exception"] = record.exc_text
+        return orjson.dumps(
+            payload, option=orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE
+        )
+
+
+class _BytesStreamHandler(logging.StreamHandler):
+    """Writes the formatter's bytes (newline included) in a single call,
+    instead of stdlib's encode + write + separate write("\n")."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record)
+            buffer = getattr(self.stream, "buffer", None)
+            if buffer is not None:
+                buffer.write(message)
+            else:
+                self.stream.write(message.decode())
+            self.flush()
+        except Exception:  # same contract as logging.StreamHandler.emit
+            self.handleError(record)
+
+
+class _RelayQueueHandler(QueueHandler):
+    """Queues the record for the listener with its context intact. The stock
+    prepare() discards exc_info outright; render it to exc_text here on the
+    producing thread instead so the listener-side formatter still has it."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+# One handler for every app this process creates; repeated create_app calls
+# (dev reloader, pytest fixtures) must not stack fresh handlers.
+_JSON_LOG_HANDLER = _BytesStreamHandler()
+_JSON_LOG_HANDLER.setFormatter(JsonFormatter())
+
+# Request threads only enqueue; the listener's daemon thread does the actual
+# formatting and stream write off the hot path.
+_LOG_QUEUE: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_QUEUE_LOG_HANDLER = _RelayQueueHandler(_LOG_QUEUE)
+_LOG_LISTENER = QueueListener(
+    _LOG_QUEUE, _JSON_LOG_HANDLER, respect_handler_level=True
+)
+_LOG_LISTENER.start()
+atexit.register(_LOG_LISTENER.stop)
+
+
+@lru_cache(maxsize=8)
+def _resolve_config(path: str) -> type:
+    """Resolve a dotted "module.ClassName" config path once per process.
+    Repeated create_app calls (the test fixtures especially) skip the
+    importlib round-trip."""
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
 
 
 def configure_logging(app: Flask) -> None:
-    handler = logging.StreamHandler()
-    handler.setFormatter(JsonFormatter())
-
-    app.logger.handlers.clear()
-    app.logger.addHandler(handler)
+    app.logger.removeHandler(default_handler)
+    if _QUEUE_LOG_HANDLER not in app.logger.handlers:
+        app.logger.addHandler(_QUEUE_LOG_HANDLER)
     app.logger.setLevel(app.config.get("LOG_LEVEL", "INFO"))
     app.logger.propagate = False
+    # werkzeug's access log would format a second, unstructured line per
+    # request alongside ours; keep only its warnings and errors.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
 
 
 def create_app(config_object: str = "config.DevelopmentConfig") -> Flask:
     app = Flask(__name__)
-    app.config.from_object(config_object)
+    app.json = OrjsonProvider(app)
+    app.config.from_object(_resolve_config(config_object))
 
     if (
         not app.config.get("DEBUG", False)
@@ -48,15 +180,28 @@ def create_app(config_object: str = "config.DevelopmentConfig") -> Flask:
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     db.init_app(app)
+    _configure_sqlite_engine(app)
     configure_logging(app)
 
-    from .routes import api_blueprint
-
     app.register_blueprint(api_blueprint, url_prefix="/api/v1")
 
-    with app.app_context():
-        from . import models
+    # One scraper + service per app; config and logger never change after
+    # startup, so there is no reason to rebuild them per request.
+    app.extensions["price_service"] = PriceComparisonService(
+        scraper=MarketplaceScraper(config=app.config, logger=app.logger),
+        logger=app.logger,
+        cache_enabled=app.config.get("SCRAPE_CACHE_ENABLED", False),
+    )
+
+    if app.config.get("AUTO_CREATE_TABLES"):
+        with app.app_context():
+            db.create_all()
+
+    start_history_writer(app)
 
+    @app.cli.command("init-db")
+    def init_db_command() -> None:
+        """Create database tables from the model metadata."""
         db.create_all()
 
     return app
@@ -0,0 +1,123 @@
+import atexit
+import threading
+from datetime import datetime
+from queue import Empty, Full, Queue
+from typing import Any, Dict, List, Optional
+
+from flask import Flask
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import SearchHistory
+
+# Bounded so a stalled database can never grow process memory without limit;
+# at the cap new rows are dropped and counted instead (history is advisory,
+# the compare response must not wait on it).
+_QUEUE_MAX_SIZE = 10000
+_BATCH_MAX_ROWS = 500
+_BATCH_WAIT_SECONDS = 0.1
+
+# Built once: SQLAlchemy caches the compiled SQL on the statement object,
+# so batches skip statement construction and compilation entirely.
+_INSERT_STATEMENT = SearchHistory.__table__.insert()
+
+_queue: "Queue[Dict[str, Any]]" = Queue(maxsize=_QUEUE_MAX_SIZE)
+_dropped_count = 0
+_state_lock = threading.Lock()
+_app: Optional[Flask] = None
+_writer_thread: Optional[threading.Thread] = None
+
+
+def enqueue_search(row: Dict[str, Any]) -> bool:
+    """Queue one history row mapping for the background writer.
+
+    The timestamp is stamped here so the record reflects when the search
+    happened, not when the batch is flushed. Returns False (and counts the
+    drop) when the queue is full."""
+    global _dropped_count
+    row.setdefault("timestamp", datetime.utcnow())
+    try:
+        _queue.put_nowait(row)
+    except Full:
+        with _state_lock:
+            _dropped_count += 1
+        return False
+    return True
+
+
+def start_history_writer(app: Flask) -> None:
+    """Bind the writer to this app and start the daemon drain thread once
+    per process. Testing configs skip the thread (their in-memory database
+    is per-context) and drain synchronously via flush_history() instead."""
+    global _app, _writer_thread
+    with _state_lock:
+        _app = app
+        if app.config.get("TESTING"):
+            return
+        if _writer_thread is not None and _writer_thread.is_alive():
+            return
+        _writer_thread = threading.Thread(
+            target=_drain_forever, name="history-writer", daemon=True
+        )
+        _writer_thread.start()
+        atexit.register(flush_history)
+
+
+def flush_history() -> None:
+    """Write everything queued so far from the calling thread.
+
+    Used by the tests and the atexit hook; safe to call while the drain
+    thread is running, since both sides pull from the same queue."""
+    if _app is None:
+        return
+    with _app.app_context():
+        while True:
+            batch = _collect_batch(wait=False)
+            if not batch:
+                return
+            _write_batch(batch)
+
+
+def dropped_count() -> int:
+    with _state_lock:
+        return _dropped_count
+
+
+def _collect_batch(wait: bool) -> List[Dict[str, Any]]:
+    batch: List[Dict[str, Any]] = []
+    try:
+        if wait:
+            batch.append(_queue.get(timeout=_BATCH_WAIT_SECONDS))
+        else:
+            batch.append(_queue.get_nowait())
+        while len(batch) < _BATCH_MAX_ROWS:
+            batch.append(_queue.get_nowait())
+    except Empty:
+        pass
+    return batch
+
+
+def _write_batch(batch: List[Dict[str, Any]]) -> None:
+    """Insert one batch inside a single transaction, amortizing the commit
+    fsync over every row in it. Executing the cached Core insert with the
+    queued dicts becomes one executemany — no ORM unit-of-work, no
+    per-batch statement compilation."""
+    try:
+        db.session.execute(_INSERT_STATEMENT, batch)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        if _app is not None:
+            _app.logger.exception(
+                "History batch write failed",
+                extra={"context": {"batch_size": len(batch)}},
+            )
+
+
+def _drain_forever() -> None:
+    while True:
+        batch = _collect_batch(wait=True)
+        if not batch:
+            continue
+        with _app.app_context():
+            _write_batch(batch)
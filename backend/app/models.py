@@ -7,10 +7,22 @@ class SearchHistory(db.Model):
     __tablename__ = "search_history"
 
     id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(2048), nullable=False, index=True)
+    url = db.Column(db.Text, nullable=False, index=True)
     marketplace = db.Column(db.String(32), nullable=False, index=True)
     source = db.Column(db.String(64), nullable=False, default="buyhatke")
     detected_price = db.Column(db.Float, nullable=True)
-    status = db.Column(db.String(16), nullable=False, index=True)
-    error_message = db.Column(db.String(1024), nullable=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    status = db.Column(db.String(16), nullable=False)
+    error_message = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Composite index answers "latest N for a status" with a backward
+        # index walk and no sort; the plain DESC index covers the unfiltered
+        # ORDER BY timestamp DESC LIMIT N used by /history.
+        db.Index(
+            "ix_search_history_status_timestamp",
+            "status",
+            db.text("timestamp DESC"),
+        ),
+        db.Index("ix_search_history_timestamp_desc", db.text("timestamp DESC")),
+    )
@@ -1,11 +1,21 @@
-from flask import Blueprint, current_app, jsonify, request
-from pydantic import ValidationError
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterator, Optional
 
+import msgspec
+import orjson
+from flask import Blueprint, Response, current_app, request, stream_with_context
+
+from . import db
 from .models import SearchHistory
-from .schemas import PriceRequest, ProductResponse
+from .schemas import (
+    AlternativeOffer,
+    PriceRequest,
+    ProductResponse,
+    validate_price_request,
+)
 from .services import (
     BotDetectionError,
-    MarketplaceScraper,
     PriceComparisonService,
     ScraperError,
     UnsupportedMarketplaceError,
@@ -15,107 +25,198 @@ from .services import (
 
 api_blueprint = Blueprint("api", __name__)
 
+# Keyset pagination bounds for /history: response size stays capped however
+# large the table grows, and the timestamp cursor pairs with the DESC index
+# so each page is an index walk, not an offset scan.
+_HISTORY_DEFAULT_LIMIT = 50
+_HISTORY_MAX_LIMIT = 200
+# Rows fetched per partition while streaming the history response.
+_HISTORY_STREAM_BATCH_SIZE = 500
+
+
+@dataclass(slots=True)
+class HistoryDTO:
+    """Fixed-shape history row for serialization. Field order matches the
+    column order of the /history select, so rows build with HistoryDTO(*row);
+    orjson serializes dataclasses natively, skipping a dict per row."""
+
+    id: int
+    url: str
+    marketplace: str
+    detected_price: Optional[float]
+    status: str
+    timestamp: datetime
+
+# Shared base for every failure response; per-error fields are spliced in
+# with msgspec.structs.replace instead of rebuilding all eleven fields.
+_FAILED_TEMPLATE = ProductResponse(
+    title="N/A",
+    source="buyhatke",
+    marketplace="unknown",
+    status="Failed",
+)
+
+# A valid compare payload is two short fields; anything bigger is junk and
+# gets rejected before the body is even read.
+_MAX_COMPARE_BODY_BYTES = 4096
+
+# One decoder instance for the process: msgspec builds the typed decode plan
+# for PriceRequest once at import instead of re-deriving it on every POST.
+_PRICE_REQUEST_DECODER = msgspec.json.Decoder(PriceRequest)
+
+# Typed scraper failure -> HTTP status, hoisted so the handler body stays flat.
+_SCRAPER_ERROR_STATUS_CODES = {
+    UnsupportedMarketplaceError: 400,
+    UpstreamNotFoundError: 404,
+    UpstreamTimeoutError: 503,
+    BotDetectionError: 503,
+}
+
+
+def _struct_response(payload: ProductResponse, status_code: int) -> Response:
+    return current_app.response_class(
+        msgspec.json.encode(payload), status=status_code, mimetype="application/json"
+    )
+
+
+def _json_response(payload: Any, status_code: int, default: Any = None) -> Response:
+    return current_app.response_class(
+        orjson.dumps(payload, default=default),
+        status=status_code,
+        mimetype="application/json",
+    )
+
 
 def _build_service() -> PriceComparisonService:
-    scraper = MarketplaceScraper(config=current_app.config, logger=current_app.logger)
-    return PriceComparisonService(scraper=scraper, logger=current_app.logger)
+    return current_app.extensions["price_service"]
 
 
 @api_blueprint.get("/health")
-def health() -> tuple:
-    return jsonify({"status": "ok"}), 200
+def health() -> Response:
+    return _json_response({"status": "ok"}, 200)
 
 
 @api_blueprint.get("/history")
-def get_history() -> tuple:
-    records = SearchHistory.query.order_by(SearchHistory.timestamp.desc()).limit(10).all()
-    return jsonify([
-        {
-            "id": r.id,
-            "url": r.url,
-            "marketplace": r.marketplace,
-            "detected_price": r.detected_price,
-            "status": r.status,
-            "timestamp": r.timestamp.isoformat(),
-        }
-        for r in records
-    ]), 200
+def get_history() -> Response:
+    """Most recent searches, newest first. `?limit=` caps the page size
+    (default 50, max 200); `?before=<iso-timestamp>&before_id=<id>` continues
+    from the previous page's oldest row — the id tiebreaker keeps rows that
+    share a timestamp from being skipped between pages."""
+    try:
+        limit = int(request.args.get("limit", _HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return _json_response(
+            {"error": "Validation failed", "details": ["limit must be an integer"]}, 400
+        )
+    limit = max(1, min(limit, _HISTORY_MAX_LIMIT))
 
+    # Core column select: plain row tuples, no ORM instance hydration.
+    statement = (
+        db.select(
+            SearchHistory.id,
+            SearchHistory.url,
+            SearchHistory.marketplace,
+            SearchHistory.detected_price,
+            SearchHistory.status,
+            SearchHistory.timestamp,
+        )
+        .order_by(SearchHistory.timestamp.desc(), SearchHistory.id.desc())
+        .limit(limit)
+    )
+    before_raw = request.args.get("before")
+    if before_raw:
+        try:
+            before = datetime.fromisoformat(before_raw)
+        except ValueError:
+            return _json_response(
+                {
+                    "error": "Validation failed",
+                    "details": ["before must be an ISO-8601 timestamp"],
+                },
+                400,
+            )
+        before_id_raw = request.args.get("before_id")
+        if before_id_raw is None:
+            statement = statement.where(SearchHistory.timestamp < before)
+        else:
+            try:
+                before_id = int(before_id_raw)
+            except ValueError:
+                return _json_response(
+                    {
+                        "error": "Validation failed",
+                        "details": ["before_id must be an integer"],
+                    },
+                    400,
+                )
+            # Composite keyset: strictly-older rows, plus same-timestamp rows
+            # with a smaller id. Still served by the DESC timestamp index.
+            statement = statement.where(
+                db.or_(
+                    SearchHistory.timestamp < before,
+                    db.and_(
+                        SearchHistory.timestamp == before,
+                        SearchHistory.id < before_id,
+                    ),
+                )
+            )
+
+    # Stream instead of materializing: rows arrive in yield_per-sized
+    # partitions and each is serialized as it passes through, so memory
+    # stays flat and the first bytes leave before the last row is read.
+    streamed = statement.execution_options(yield_per=_HISTORY_STREAM_BATCH_SIZE)
+
+    def generate_rows() -> Iterator[bytes]:
+        yield b"["
+        separator = b""
+        for row in db.session.execute(streamed):
+            yield separator + orjson.dumps(HistoryDTO(*row))
+            separator = b","
+        yield b"]"
+
+    return current_app.response_class(
+        stream_with_context(generate_rows()), mimetype="application/json"
+    )
 
-@api_blueprint.post("/compare")
-def compare_price() -> tuple:
-    payload = request.get_json(silent=True) or {}
 
+@api_blueprint.post("/compare")
+def compare_price() -> Response:
+    # Header-only fast rejects: no body read, no typed decode.
+    if request.content_length is not None and request.content_length > _MAX_COMPARE_BODY_BYTES:
+        return _json_response(
+            {"error": "Validation failed", "details": ["Request body is too large"]}, 400
+        )
+    if request.mimetype != "application/json":
+        return _json_response(
+            {"error": "Validation failed", "details": ["Content-Type must be application/json"]},
+            400,
+        )
     try:
-        validated_request = PriceRequest.model_validate(payload)
-    except ValidationError as exc:
-        details = []
-        for issue in exc.errors():
-            if "ctx" in issue and isinstance(issue["ctx"], dict):
-                issue["ctx"] = {key: str(value) for key, value in issue["ctx"].items()}
-            details.append(issue)
-        return jsonify({"error": "Validation failed", "details": details}), 400
+        # Single typed pass over the raw body: msgspec decodes and shape-checks
+        # in one step instead of Flask's json parse plus a validation re-walk.
+        validated_request = _PRICE_REQUEST_DECODER.decode(
+            request.get_data(cache=False) or b"{}"
+        )
+        validated_request = validate_price_request(validated_request)
+    except ValueError as exc:  # msgspec decode errors are ValueError subclasses
+        return _json_response({"error": "Validation failed", "details": [str(exc)]}, 400)
 
     service = _build_service()
-    url = str(validated_request.url)
+    url = validated_request.url
 
     try:
         result = service.compare(url=url, marketplace=validated_request.marketplace)
-        validated_response = ProductResponse.model_validate(result)
-        return jsonify(validated_response.model_dump(mode="json")), 200
-    except UnsupportedMarketplaceError as exc:
-        response = ProductResponse(
-            title="N/A",
-            price=None,
-            image_url=None,
-            source="buyhatke",
-            marketplace=validated_request.marketplace or "unknown",
-            tracker_url=None,
-            alternatives_count=0,
-            alternatives=[],
-            status="Failed",
-            error=str(exc),
-        )
-        return jsonify(response.model_dump(mode="json")), 400
-    except UpstreamNotFoundError as exc:
-        response = ProductResponse(
-            title="N/A",
-            price=None,
-            image_url=None,
-            source="buyhatke",
-            marketplace=validated_request.marketplace or "unknown",
-            tracker_url=None,
-            alternatives_count=0,
-            alternatives=[],
-            status="Failed",
-            error=str(exc),
-        )
-        return jsonify(response.model_dump(mode="json")), 404
-    except (UpstreamTimeoutError, BotDetectionError) as exc:
-        response = ProductResponse(
-            title="N/A",
-            price=None,
-            image_url=None,
-            source="buyhatke",
-            marketplace=validated_request.marketplace or "unknown",
-            tracker_url=None,
-            alternatives_count=0,
-            alternatives=[],
-            status="Failed",
-            error=str(exc),
+        # The service result is trusted internal data; construct the Structs
+        # directly instead of paying for a full msgspec.convert validation pass.
+        result["alternatives"] = tuple(
+            AlternativeOffer(**offer) for offer in result["alternatives"]
         )
-        return jsonify(response.model_dump(mode="json")), 503
+        result["thumbnail_images"] = tuple(result["thumbnail_images"])
+        return _struct_response(ProductResponse(**result), 200)
     except ScraperError as exc:
-        response = ProductResponse(
-            title="N/A",
-            price=None,
-            image_url=None,
-            source="buyhatke",
+        response = msgspec.structs.replace(
+            _FAILED_TEMPLATE,
             marketplace=validated_request.marketplace or "unknown",
-            tracker_url=None,
-            alternatives_count=0,
-            alternatives=[],
-            status="Failed",
             error=str(exc),
         )
-        return jsonify(response.model_dump(mode="json")), 502
+        return _struct_response(response, _SCRAPER_ERROR_STATUS_CODES.get(type(exc), 502))
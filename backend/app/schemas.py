@@ -1,71 +1,93 @@
 import re
-from typing import List, Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 
-from pydantic import BaseModel, ConfigDict, Field, HttpUrl, field_validator
-
-SUPPORTED_MARKETPLACE_PATTERNS = {
-    "amazon": re.compile(r"(?:^|\.)amazon\.(?:in|com)$", re.IGNORECASE),
-    "flipkart": re.compile(r"(?:^|\.)flipkart\.com$", re.IGNORECASE),
+import msgspec
+
+# One alternation instead of one pattern per marketplace: a single regex
+# engine invocation classifies the host, and the suffix map names it.
+_MARKETPLACE_HOST_PATTERN = re.compile(
+    r"(?:^|\.)(amazon\.(?:in|com)|flipkart\.com)$", re.IGNORECASE
+)
+_MARKETPLACE_BY_HOST_SUFFIX = {
+    "amazon.in": "amazon",
+    "amazon.com": "amazon",
+    "flipkart.com": "flipkart",
 }
+SUPPORTED_MARKETPLACES = frozenset(_MARKETPLACE_BY_HOST_SUFFIX.values())
 
 
-def detect_marketplace(url: str) -> Optional[str]:
-    hostname = urlparse(url).hostname or ""
-    for marketplace, pattern in SUPPORTED_MARKETPLACE_PATTERNS.items():
-        if pattern.search(hostname):
-            return marketplace
-    return None
-
-
-class PriceRequest(BaseModel):
-    model_config = ConfigDict(extra="forbid")
+def _extract_hostname(url: str) -> str:
+    # Fast path for well-formed http(s) URLs: slice the authority out
+    # directly instead of building a full ParseResult. Anything unusual
+    # (userinfo-free splits that come up empty, other schemes) falls back
+    # to urlparse.
+    if url.startswith(("http://", "https://")):
+        parts = url.split("/", 3)
+        if len(parts) > 2 and parts[2]:
+            return parts[2].rsplit("@", 1)[-1].split(":", 1)[0].lower()
+    return urlparse(url).hostname or ""
 
-    url: HttpUrl = Field(..., description="Product URL from a supported marketplace")
-    marketplace: Optional[str] = Field(default=None, description="Marketplace override")
-
-    @field_validator("url")
-    @classmethod
-    def url_must_be_supported(cls, value: HttpUrl) -> HttpUrl:
-        if detect_marketplace(str(value)) is None:
-            raise ValueError("Unsupported marketplace URL. Allowed: Amazon, Flipkart")
-        return value
-
-    @field_validator("marketplace")
-    @classmethod
-    def marketplace_must_be_supported(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return value
-        normalized = value.strip().lower()
-        if normalized not in SUPPORTED_MARKETPLACE_PATTERNS:
-            raise ValueError("Unsupported marketplace. Allowed: amazon, flipkart")
-        return normalized
 
+@lru_cache(maxsize=4096)
+def detect_marketplace(url: str) -> Optional[str]:
+    match = _MARKETPLACE_HOST_PATTERN.search(_extract_hostname(url))
+    if match is None:
+        return None
+    return _MARKETPLACE_BY_HOST_SUFFIX[match.group(1).lower()]
+
+
+_MAX_URL_LENGTH = 2048
+
+
+class PriceRequest(msgspec.Struct, forbid_unknown_fields=True, frozen=True):
+    """Incoming /compare payload. Shape checks (required url, unknown-field
+    rejection) happen during msgspec decoding; the semantic checks live in
+    validate_price_request."""
+
+    url: str
+    marketplace: Optional[str] = None
+
+
+def validate_price_request(price_request: PriceRequest) -> PriceRequest:
+    """Run the semantic checks a decoded PriceRequest still needs and return
+    it with the marketplace override normalized. Raises ValueError on any
+    unsupported input, mirroring the old pydantic validators."""
+    url = price_request.url
+    if len(url) > _MAX_URL_LENGTH:
+        raise ValueError("URL is too long")
+    if not url.startswith(("http://", "https://")):
+        raise ValueError("URL must start with http:// or https://")
+    if detect_marketplace(url) is None:
+        raise ValueError("Unsupported marketplace URL. Allowed: Amazon, Flipkart")
+    if price_request.marketplace is None:
+        return price_request
+    normalized = price_request.marketplace.strip().lower()
+    if normalized not in SUPPORTED_MARKETPLACES:
+        raise ValueError("Unsupported marketplace. Allowed: amazon, flipkart")
+    if normalized == price_request.marketplace:
+        return price_request
+    return msgspec.structs.replace(price_request, marketplace=normalized)
+
+
+class AlternativeOffer(msgspec.Struct, forbid_unknown_fields=True, frozen=True):
+    seller: str
+    price: Optional[float] = None
+    price_display: str = "N/A"
+    link: Optional[str] = None
+    logo_url: Optional[str] = None
 
-class ProductResponse(BaseModel):
-    model_config = ConfigDict(extra="forbid")
 
+class ProductResponse(msgspec.Struct, forbid_unknown_fields=True, frozen=True):
     title: str
-    price: Optional[float] = None
-    image_url: Optional[str] = None
-    thumbnail_images: List[str] = Field(default_factory=list)
     source: str
     marketplace: str
+    status: str
+    price: Optional[float] = None
+    image_url: Optional[str] = None
+    thumbnail_images: Tuple[str, ...] = ()
     tracker_url: Optional[str] = None
     alternatives_count: int = 0
-    alternatives: List["AlternativeOffer"] = Field(default_factory=list)
-    status: str
+    alternatives: Tuple[AlternativeOffer, ...] = ()
     error: Optional[str] = None
-
-
-class AlternativeOffer(BaseModel):
-    model_config = ConfigDict(extra="forbid")
-
-    seller: str
-    price: Optional[float] = None
-    price_display: str = "N/A"
-    link: Optional[str] = None
-    logo_url: Optional[str] = None
-
-
-ProductResponse.model_rebuild()
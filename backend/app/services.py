@@ -1,13 +1,31 @@
-import json
 import logging
 import re
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import parse_qs, quote, urljoin, urlparse
+from functools import lru_cache
+from statistics import quantiles
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl, quote, urlencode, urljoin, urlparse
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter, Retry
+
+# Prefer the C-backed lxml parser; html.parser is the pure-Python fallback
+# so a missing optional dependency degrades speed, not behavior.
+try:
+    import lxml  # noqa: F401
+
+    _HTML_PARSER = "lxml"
+except ImportError:  # pragma: no cover - depends on the installed environment
+    _HTML_PARSER = "html.parser"
 
 # Known seller → BuyHatke CDN logo URLs (filenames confirmed from live HTML)
 SELLER_LOGO_MAP: Dict[str, str] = {
@@ -54,11 +72,206 @@ SELLER_POS_MAP: Dict[str, int] = {
     "bigbasket":        8711,
 }
 
-from . import db
-from .models import SearchHistory
+from .history_writer import enqueue_search
 from .schemas import detect_marketplace
 
 
+# Hedging: when the primary upstream GET exceeds the observed P95 latency, a
+# duplicate GET races it and the first finisher wins. Spend at most one hedge
+# per _HEDGE_BUDGET_RATIO requests so slow upstreams cannot double our load.
+# Precompiled patterns for the hot parsing paths; compiling once at import
+# beats per-call lookups in re's internal pattern cache.
+_SLUG_RE = re.compile(r"[^\w-]+")
+# One alternation over every known seller name, longest first so e.g.
+# "ajio lux" wins over "ajio": a single regex scan replaces trying each
+# SELLER_LOGO_MAP key against the seller string in turn.
+_SELLER_LOGO_KEY_RE = re.compile(
+    "|".join(
+        re.escape(key)
+        for key in sorted(SELLER_LOGO_MAP, key=len, reverse=True)
+    )
+)
+
+# Relative logo URLs, most specific prefix first; only consulted after the
+# quick absolute-URL accept and the single leading-slash check.
+_LOGO_URL_PREFIX_RULES: Tuple[Tuple[str, str], ...] = (
+    ("//", "https:"),
+    ("/images/", "https://compare.buyhatke.com"),
+    ("/", "https://buyhatke.com"),
+)
+
+# Depth guard for __NEXT_DATA__ walks: anything nested deeper than this is
+# framework plumbing, not deal data.
+_JSON_WALK_MAX_DEPTH = 15
+
+# Keys whose presence in a list's first dict marks it as possibly being the
+# price-comparison array; lists without any of them (breadcrumbs, image
+# arrays, …) are descended into without the per-item parse sweep.
+_PRICE_KEY_HINTS = frozenset(
+    {"price", "cur_price", "selling_price", "sp", "mrp", "site_name", "siteName", "seller"}
+)
+
+# Only these tags (and their contents) are material to alternatives
+# extraction; everything else is dropped during parsing itself.
+_ALTERNATIVES_STRAINER = SoupStrainer(["script", "section", "div", "ul"])
+_DEALS_LIST_MARKER_RE = re.compile(r"dealsList:\[")
+
+# Quotes bare JS object keys ({key: -> {"key":) so a dealsList written as a
+# JS literal can be handed to the C json parser.
+_JS_BARE_KEY_RE = re.compile(r"([{,])([A-Za-z_][A-Za-z0-9_]*):")
+_DEAL_FIELDS_RE = re.compile(
+    r'site_name:"(?P<site_name>[^"]*)"'
+    r'|\blink:"(?P<link>[^"]*)"'
+    r"|\bposition:(?P<position>\d+)"
+    r"|\bprice:(?P<price>\d+(?:\.\d+)?)"
+    r'|site_(?:logo|image):"(?P<logo>[^"]*)"'
+)
+_CAPITALIZE_CLASS_RE = re.compile(r"capitalize")
+_FONT_BOLD_CLASS_RE = re.compile(r"font-bold")
+_NUMBER_RE = re.compile(r"[\d,]+(?:\.\d+)?")
+_RUPEE_PRICE_RE = re.compile(r"₹\s*([\d,]+(?:\.\d+)?)")
+_ONCLICK_URL_RE = re.compile(r"https?://[^'\")\s]+")
+_AMAZON_PRODUCT_ID_RE = re.compile(r"/(?:dp|gp/product)/([A-Z0-9]{10})")
+_FLIPKART_PID_RE = re.compile(r"pid=([A-Z0-9]+)")
+
+# Prices change slowly relative to request bursts; a short TTL keeps repeat
+# queries from re-fetching (and re-parsing) identical upstream data while
+# still reflecting price movement within a couple of minutes.
+_CACHE_TTL_SECONDS = 120
+_JSON_CACHE_SIZE = 4096
+_ALTERNATIVES_CACHE_SIZE = 1024
+
+# Connection pool sized for bursts across the handful of upstream hosts;
+# transient gateway errors are retried with backoff, but the final response
+# is still returned (raise_on_status=False) so the 404/503 handling in
+# _fetch keeps classifying persistent failures.
+_POOL_CONNECTIONS = 32
+_POOL_MAXSIZE = 64
+_RETRY_TOTAL = 2
+_RETRY_BACKOFF_SECONDS = 0.3
+_RETRY_STATUS_CODES = (502, 503, 504)
+
+# Full-result cache in front of scrape(): repeat compares for the same
+# product inside the TTL skip upstream I/O and parsing entirely.
+_SCRAPE_RESULT_CACHE_SIZE = 1024
+_SCRAPE_RESULT_TTL_SECONDS = 300
+_TRACKING_QUERY_KEYS = frozenset({"ref", "tag", "linkCode"})
+
+_HEDGE_MIN_SAMPLES = 20
+_HEDGE_SAMPLE_WINDOW = 64
+_HEDGE_BUDGET_RATIO = 10
+
+
+class _LatencyTracker:
+    """Ring buffer of recent upstream fetch durations for hedge-delay estimation."""
+
+    def __init__(self, window: int = _HEDGE_SAMPLE_WINDOW) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, duration: float) -> None:
+        with self._lock:
+            self._samples.append(duration)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < _HEDGE_MIN_SAMPLES:
+                return None
+            return quantiles(self._samples, n=20)[-1]
+
+
+@lru_cache(maxsize=4096)
+def _extract_product_id(url: str, marketplace: str) -> Optional[str]:
+    """Pull the marketplace product identifier out of a product URL.
+
+    Memoized at module level: repeat lookups for the same URL (retries,
+    popular products) skip the regex and query-string work entirely."""
+    if marketplace == "amazon":
+        match = _AMAZON_PRODUCT_ID_RE.search(url)
+        return match.group(1) if match else None
+
+    if marketplace == "flipkart":
+        parsed_url = urlparse(url)
+        query_params = parse_qs(parsed_url.query)
+        pid = query_params.get("pid", [None])[0]
+        if pid:
+            return pid
+        match = _FLIPKART_PID_RE.search(url)
+        return match.group(1) if match else None
+
+    return None
+
+
+def canonicalize_url(url: str) -> str:
+    """Stable cache key for a product URL: lowercase host and identity
+    parameters only. Amazon collapses to /dp/<ASIN> and Flipkart to its pid,
+    so every URL variant of the same product shares one cache entry; other
+    URLs just lose their fragment and tracking parameters (utm_*, ref, …)."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    marketplace = detect_marketplace(url)
+    if marketplace is not None:
+        product_id = _extract_product_id(url, marketplace)
+        if product_id:
+            if marketplace == "amazon":
+                return f"https://{host}/dp/{product_id}"
+            return f"https://{host}{parsed.path}?pid={product_id}"
+    kept_query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parsed.query)
+            if key not in _TRACKING_QUERY_KEYS and not key.startswith("utm_")
+        ]
+    )
+    if kept_query:
+        return f"https://{host}{parsed.path}?{kept_query}"
+    return f"https://{host}{parsed.path}"
+
+
+# %-format template: one C-level interpolation per link instead of four
+# chained f-string pieces at every call site.
+_TRACKING_TEMPLATE = (
+    "https://tracking.buyhatke.com/Navigation/?pos=%s&source=price-tracker"
+    "&ext1=product_deal_card&ext2=&link=%s"
+)
+
+
+def _tracking_link(position: Any, url: str) -> str:
+    """Build the BuyHatke tracking redirect for a seller's buy URL."""
+    return _TRACKING_TEMPLATE % (position, quote(url, safe=""))
+
+
+def _format_price_display(price: Optional[float]) -> str:
+    """Render a price as the UI string (whole rupees without decimals,
+    otherwise two places), or N/A when there is no price."""
+    if price is None:
+        return "N/A"
+    if price.is_integer():
+        return f"₹{int(price):,}"
+    return f"₹{price:,.2f}"
+
+
+def _sort_offers_by_price(offers: List[Dict[str, Any]]) -> None:
+    """Order offers cheapest-first with unpriced entries last, in place.
+
+    Decorate-sort-undecorate: the key tuple is built once per offer up
+    front instead of through a lambda call per comparison, and the index
+    keeps the sort stable without ever comparing the dicts themselves."""
+    decorated = [
+        (offer["price"] is None, offer["price"] or 0.0, index)
+        for index, offer in enumerate(offers)
+    ]
+    decorated.sort()
+    offers[:] = [offers[index] for _, _, index in decorated]
+
+
+def _close_abandoned_response(future: Future) -> None:
+    """Return the losing hedge's connection to the pool once it finishes."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    future.result().close()
+
+
 class ScraperError(Exception):
     pass
 
@@ -111,13 +324,53 @@ class MarketplaceScraper(BaseScraper):
             "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         )
         self.logger = logger
+        # Keep-alive session: reuse TCP/TLS connections to buyhatke hosts
+        # instead of paying DNS + handshake on every fetch.
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = self.user_agent
+        adapter = HTTPAdapter(
+            pool_connections=_POOL_CONNECTIONS,
+            pool_maxsize=_POOL_MAXSIZE,
+            max_retries=Retry(
+                total=_RETRY_TOTAL,
+                backoff_factor=_RETRY_BACKOFF_SECONDS,
+                status_forcelist=_RETRY_STATUS_CODES,
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # Lets the tracker-page download overlap with productData processing.
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="scraper-fetch"
+        )
+        # Separate pool for hedged GETs so a hedge can never deadlock behind
+        # the tracker-overlap worker that is waiting on it.
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="scraper-hedge"
+        )
+        self._latency = _LatencyTracker()
+        self._hedge_lock = threading.Lock()
+        self._request_count = 0
+        self._hedge_count = 0
+        # Single-flight: concurrent callers for the same URL share one
+        # upstream fetch instead of issuing duplicates.
+        self._in_flight: Dict[str, Future] = {}
+        self._in_flight_lock = threading.Lock()
+        self._cache_lock = threading.RLock()
+        self._json_cache: TTLCache = TTLCache(
+            maxsize=_JSON_CACHE_SIZE, ttl=_CACHE_TTL_SECONDS
+        )
+        self._alternatives_cache: TTLCache = TTLCache(
+            maxsize=_ALTERNATIVES_CACHE_SIZE, ttl=_CACHE_TTL_SECONDS
+        )
 
     def scrape(self, url: str, marketplace: Optional[str] = None) -> ScrapeResult:
         resolved_marketplace = marketplace or detect_marketplace(url)
         if resolved_marketplace not in self.MARKETPLACE_POSITIONS:
             raise UnsupportedMarketplaceError("Marketplace is not supported by current scraper")
 
-        product_id = self._extract_product_id(url, resolved_marketplace)
+        product_id = _extract_product_id(url, resolved_marketplace)
         if not product_id:
             raise ScraperError("Could not extract product identifier from URL")
 
@@ -133,39 +386,28 @@ class MarketplaceScraper(BaseScraper):
 
         title = data.get("name") or "Unknown Product"
         price = self._to_float(data.get("cur_price"))
-        site_pos = data.get("site_pos")
-        internal_pid = data.get("internalPid")
-        image_url = None
-        thumbnail_images: List[str] = []
-        raw_thumbnails = data.get("thumbnailImages")
-        if isinstance(raw_thumbnails, list) and raw_thumbnails:
-            thumbnail_images = [str(t) for t in raw_thumbnails if t]
-            image_url = thumbnail_images[0]
-        elif isinstance(data.get("image"), str):
-            image_url = data.get("image")
-            thumbnail_images = [image_url] if image_url else []
 
         tracker_url = self._build_tracker_url(
             marketplace=resolved_marketplace,
             title=title,
-            site_pos=site_pos,
-            internal_pid=internal_pid,
+            site_pos=data.get("site_pos"),
+            internal_pid=data.get("internalPid"),
         )
-
-        alternatives: List[Dict[str, Any]] = []
+        # Start the tracker-page download immediately; the remaining
+        # productData fields are processed while it is in flight. A cache hit
+        # skips the download and the parse entirely.
+        tracker_future: Optional[Future] = None
+        cached_alternatives: Optional[List[Dict[str, Any]]] = None
         if tracker_url:
-            try:
-                alternatives = self._scrape_alternatives(tracker_url)
-            except ScraperError as exc:
-                self.logger.warning(
-                    "Alternative scraping failed",
-                    extra={
-                        "context": {
-                            "tracker_url": tracker_url,
-                            "error": str(exc),
-                        }
-                    },
-                )
+            cached_alternatives = self._get_cached_alternatives(tracker_url)
+            if cached_alternatives is None:
+                tracker_future = self._executor.submit(self._get_response, tracker_url)
+
+        image_url, thumbnail_images = self._extract_images(data)
+        if cached_alternatives is not None:
+            alternatives = cached_alternatives
+        else:
+            alternatives = self._collect_alternatives(tracker_future, tracker_url)
 
         return ScrapeResult(
             title=title,
@@ -178,6 +420,46 @@ class MarketplaceScraper(BaseScraper):
             alternatives=alternatives,
         )
 
+    @staticmethod
+    def _extract_images(data: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
+        raw_thumbnails = data.get("thumbnailImages")
+        if isinstance(raw_thumbnails, list) and raw_thumbnails:
+            thumbnail_images = [str(thumbnail) for thumbnail in raw_thumbnails if thumbnail]
+            return (thumbnail_images[0] if thumbnail_images else None), thumbnail_images
+        if isinstance(data.get("image"), str):
+            image_url = data.get("image")
+            return image_url, ([image_url] if image_url else [])
+        return None, []
+
+    def _get_cached_alternatives(
+        self, tracker_url: str
+    ) -> Optional[List[Dict[str, Any]]]:
+        with self._cache_lock:
+            cached = self._alternatives_cache.get(tracker_url)
+        return list(cached) if cached is not None else None
+
+    def _collect_alternatives(
+        self, tracker_future: Optional[Future], tracker_url: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        if tracker_future is None:
+            return []
+        try:
+            alternatives = self._parse_alternatives(tracker_future.result(), tracker_url)
+            with self._cache_lock:
+                self._alternatives_cache[tracker_url] = alternatives
+            return alternatives
+        except ScraperError as exc:
+            self.logger.warning(
+                "Alternative scraping failed",
+                extra={
+                    "context": {
+                        "tracker_url": tracker_url,
+                        "error": str(exc),
+                    }
+                },
+            )
+            return []
+
     def _build_tracker_url(
         self,
         marketplace: str,
@@ -187,14 +469,20 @@ class MarketplaceScraper(BaseScraper):
     ) -> Optional[str]:
         if site_pos is None or internal_pid in (None, ""):
             return None
-        slug = re.sub(r"[^\w-]+", "-", str(title).lower()).strip("-")
+        slug = _SLUG_RE.sub("-", str(title).lower()).strip("-")
         if not slug:
             slug = f"product-{internal_pid}"
         return f"https://buyhatke.com/{marketplace}-{slug}-price-in-india-{site_pos}-{internal_pid}"
 
-    def _scrape_alternatives(self, tracker_url: str) -> List[Dict[str, Any]]:
-        response = self._get_response(tracker_url)
-        soup = BeautifulSoup(response.text, "html.parser")
+    def _parse_alternatives(
+        self, response: requests.Response, tracker_url: str
+    ) -> List[Dict[str, Any]]:
+        # Bytes in, so the parser handles encoding detection itself instead of
+        # requests running a full Python-level decode first; the strainer
+        # prunes irrelevant subtrees during the parse.
+        soup = BeautifulSoup(
+            response.content, _HTML_PARSER, parse_only=_ALTERNATIVES_STRAINER
+        )
 
         # ── Primary: SvelteKit bootstrap script has link + position + logo ────
         results = self._extract_from_sveltekit(soup)
@@ -203,7 +491,18 @@ class MarketplaceScraper(BaseScraper):
 
         # ── Fallback A: HTML extraction (logos/prices) + __NEXT_DATA__ links ──
         results = self._extract_from_html(soup, tracker_url)
-        link_map = self._extract_link_map_from_next_data(soup)
+        # Only walk __NEXT_DATA__ for the sellers that actually lack a link,
+        # and let the walker bail out as soon as it has found all of them.
+        missing_link_keys = frozenset(
+            entry["seller"].lower().strip()
+            for entry in results
+            if not entry.get("link")
+        )
+        link_map = (
+            self._extract_link_map_from_next_data(soup, target_keys=missing_link_keys)
+            if missing_link_keys
+            else {}
+        )
         for entry in results:
             if not entry.get("link"):
                 key = entry["seller"].lower().strip()
@@ -226,16 +525,14 @@ class MarketplaceScraper(BaseScraper):
     def _extract_from_sveltekit(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
         """Parse the SvelteKit bootstrap script which contains a dealsList JS array
         with link, position, site_name, site_logo/site_image per seller."""
-        for script in soup.find_all("script"):
+        # Content-filtered find: BS4 skips non-matching scripts during
+        # traversal instead of us iterating every script tag.
+        script = soup.find("script", string=_DEALS_LIST_MARKER_RE)
+        if script is not None:
             txt = script.string or ""
-            if "dealsList:" not in txt:
-                continue
 
             marker = "dealsList:["
-            start = txt.find(marker)
-            if start == -1:
-                continue
-            start += len(marker)
+            start = txt.find(marker) + len(marker)
 
             # Walk forward to find the matching closing ]
             depth = 1
@@ -258,49 +555,40 @@ class MarketplaceScraper(BaseScraper):
                 i += 1
 
             deals_raw = txt[start: i - 1]
-            items_raw = self._split_js_objects(deals_raw)
+            # Prefer one C-level orjson parse over the pure-Python object split
+            # + per-item regex scan; fall back when the JS isn't JSON enough.
+            deal_fields = self._parse_deals_json(deals_raw)
+            if deal_fields is None:
+                deal_fields = [
+                    self._parse_deal_fields(item_str)
+                    for item_str in self._split_js_objects(deals_raw)
+                ]
 
             results: List[Dict[str, Any]] = []
             seen: set = set()
 
-            for item_str in items_raw:
-                site_name_m = re.search(r'site_name:"([^"]*)"', item_str)
-                link_m = re.search(r'\blink:"([^"]*)"', item_str)
-                position_m = re.search(r'\bposition:(\d+)', item_str)
-                price_m = re.search(r'\bprice:(\d+(?:\.\d+)?)', item_str)
-                logo_m = (
-                    re.search(r'site_logo:"([^"]*)"', item_str)
-                    or re.search(r'site_image:"([^"]*)"', item_str)
-                )
-
-                if not (site_name_m and link_m and position_m):
+            for fields in deal_fields:
+                if not ("site_name" in fields and "link" in fields and "position" in fields):
                     continue
 
-                seller = site_name_m.group(1).strip()
-                product_url = link_m.group(1).strip()
-                pos = int(position_m.group(1))
-                price_val = self._to_float(price_m.group(1)) if price_m else None
-                logo = logo_m.group(1).strip() if logo_m else self._resolve_logo_url(None, seller)
-
-                tracking_link = (
-                    f"https://tracking.buyhatke.com/Navigation/"
-                    f"?pos={pos}&source=price-tracker"
-                    f"&ext1=product_deal_card&ext2="
-                    f"&link={quote(product_url, safe='')}"
+                seller = str(fields["site_name"]).strip()
+                product_url = str(fields["link"]).strip()
+                pos = int(fields["position"])
+                price_val = self._to_float(fields.get("price"))
+                logo = (
+                    str(fields["logo"]).strip()
+                    if "logo" in fields
+                    else self._resolve_logo_url(None, seller)
                 )
 
-                fp = f"{seller}|{price_val}"
-                if fp in seen:
+                tracking_link = _tracking_link(pos, product_url)
+
+                fingerprint = (seller.casefold(), price_val)
+                if fingerprint in seen:
                     continue
-                seen.add(fp)
+                seen.add(fingerprint)
 
-                if price_val is not None:
-                    price_display = (
-                        f"₹{int(price_val):,}" if price_val == int(price_val)
-                        else f"₹{price_val:,.2f}"
-                    )
-                else:
-                    price_display = "N/A"
+                price_display = _format_price_display(price_val)
 
                 results.append({
                     "seller": seller,
@@ -310,19 +598,52 @@ class MarketplaceScraper(BaseScraper):
                     "logo_url": logo,
                 })
 
-            results.sort(
-                key=lambda e: (
-                    e["price"] is None,
-                    e["price"] if e["price"] is not None else float("inf"),
-                )
-            )
+            _sort_offers_by_price(results)
             return results
 
         return []
 
+    @staticmethod
+    def _parse_deals_json(deals_raw: str) -> Optional[List[Dict[str, Any]]]:
+        """Parse the dealsList body as JSON after quoting bare keys. Returns
+        None when the array isn't valid JSON (single quotes, embedded JS),
+        in which case the caller uses the character-walker fallback."""
+        quoted = _JS_BARE_KEY_RE.sub(r'\1"\2":', deals_raw)
+        try:
+            parsed = orjson.loads(f"[{quoted}]")
+        except ValueError:
+            return None
+        items: List[Dict[str, Any]] = []
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            fields: Dict[str, Any] = {}
+            for key in ("site_name", "link", "position", "price"):
+                if item.get(key) is not None:
+                    fields[key] = item[key]
+            logo = item.get("site_logo") or item.get("site_image")
+            if isinstance(logo, str):
+                fields["logo"] = logo
+            items.append(fields)
+        return items
+
+    @staticmethod
+    def _parse_deal_fields(item_str: str) -> Dict[str, str]:
+        """Collect a deal item's fields in one scan of the combined
+        alternation instead of one re.search pass per field. The first
+        occurrence of each field wins, matching the old search semantics."""
+        fields: Dict[str, str] = {}
+        for match in _DEAL_FIELDS_RE.finditer(item_str):
+            group = match.lastgroup
+            if group is not None and group not in fields:
+                fields[group] = match.group(group)
+        return fields
+
     @staticmethod
     def _split_js_objects(txt: str) -> List[str]:
-        """Split a JS array body string into individual top-level object strings."""
+        """Split a JS array body string into individual top-level object
+        strings, tracking brace depth and string state so nested objects and
+        braces inside quoted values don't produce false boundaries."""
         objects: List[str] = []
         depth = 0
         start: Optional[int] = None
@@ -353,40 +674,58 @@ class MarketplaceScraper(BaseScraper):
 
     # ── __NEXT_DATA__ link-map extraction ──────────────────────────────────────
 
-    def _extract_link_map_from_next_data(self, soup: BeautifulSoup) -> Dict[str, str]:
-        """Return {seller_name_lower: buy_url} by walking __NEXT_DATA__ JSON."""
+    def _extract_link_map_from_next_data(
+        self, soup: BeautifulSoup, target_keys: Optional[FrozenSet[str]] = None
+    ) -> Dict[str, str]:
+        """Return {seller_name_lower: buy_url} by walking __NEXT_DATA__ JSON.
+        When target_keys is given, the walk stops once all of them are found."""
         script = soup.find("script", id="__NEXT_DATA__")
         if not script or not script.string:
             return {}
         try:
-            next_data = json.loads(script.string)
+            # script.string is a NavigableString subclass of str, which
+            # orjson rejects outright; hand it bytes instead.
+            next_data = orjson.loads(script.string.encode())
         except (ValueError, TypeError):
             return {}
         link_map: Dict[str, str] = {}
-        self._walk_json_for_links(next_data, link_map, depth=0)
+        self._walk_json_for_links(next_data, link_map, depth=0, target_keys=target_keys)
         return link_map
 
-    def _walk_json_for_links(self, node: Any, out: Dict[str, str], depth: int) -> None:
-        if depth > 15:
-            return
-        if isinstance(node, list):
-            for item in node:
-                self._walk_json_for_links(item, out, depth + 1)
-        elif isinstance(node, dict):
+    def _walk_json_for_links(
+        self,
+        node: Any,
+        out: Dict[str, str],
+        depth: int,
+        target_keys: Optional[FrozenSet[str]] = None,
+    ) -> None:
+        # Explicit-stack DFS: large __NEXT_DATA__ trees would otherwise pay a
+        # Python frame per node. Children are pushed reversed so the visit
+        # order (and therefore first-seller-wins) matches the old recursion.
+        stack: Deque[Tuple[Any, int]] = deque([(node, depth)])
+        while stack:
+            current, current_depth = stack.pop()
+            if current_depth > _JSON_WALK_MAX_DEPTH:
+                continue
+            if isinstance(current, list):
+                stack.extend((item, current_depth + 1) for item in reversed(current))
+                continue
+            if not isinstance(current, dict):
+                continue
             seller = (
-                node.get("site_name") or node.get("siteName")
-                or node.get("seller") or node.get("store")
-                or node.get("source")
+                current.get("site_name") or current.get("siteName")
+                or current.get("seller") or current.get("store")
+                or current.get("source")
             )
             raw_url = (
-                node.get("url") or node.get("buy_url") or node.get("buyUrl")
-                or node.get("affiliate_url") or node.get("affiliateUrl")
-                or node.get("offerUrl") or node.get("offer_url")
-                or node.get("deep_link") or node.get("deeplink")
-                or node.get("link")
+                current.get("url") or current.get("buy_url") or current.get("buyUrl")
+                or current.get("affiliate_url") or current.get("affiliateUrl")
+                or current.get("offerUrl") or current.get("offer_url")
+                or current.get("deep_link") or current.get("deeplink")
+                or current.get("link")
             )
             # site_pos from __NEXT_DATA__ is the destination seller's tracking ID
-            pos = node.get("site_pos") or node.get("sitePos") or node.get("pos")
+            pos = current.get("site_pos") or current.get("sitePos") or current.get("pos")
 
             if seller and raw_url:
                 key = str(seller).strip().lower()
@@ -396,16 +735,14 @@ class MarketplaceScraper(BaseScraper):
                 if url_str.startswith("http") and key not in out:
                     resolved_pos = pos or SELLER_POS_MAP.get(key)
                     if resolved_pos:
-                        out[key] = (
-                            f"https://tracking.buyhatke.com/Navigation/"
-                            f"?pos={resolved_pos}&source=price-tracker"
-                            f"&ext1=product_deal_card&ext2="
-                            f"&link={quote(url_str, safe='')}"
-                        )
+                        out[key] = _tracking_link(resolved_pos, url_str)
                     else:
                         out[key] = url_str
-            for value in node.values():
-                self._walk_json_for_links(value, out, depth + 1)
+                    if target_keys is not None and target_keys <= out.keys():
+                        return
+            stack.extend(
+                (value, current_depth + 1) for value in reversed(list(current.values()))
+            )
 
     # ── __NEXT_DATA__ full extraction (fallback only) ─────────────────────────
 
@@ -416,7 +753,8 @@ class MarketplaceScraper(BaseScraper):
         if not script or not script.string:
             return []
         try:
-            next_data = json.loads(script.string)
+            # Same NavigableString-to-bytes dance as the link-map extractor.
+            next_data = orjson.loads(script.string.encode())
         except (ValueError, TypeError):
             return []
 
@@ -426,32 +764,41 @@ class MarketplaceScraper(BaseScraper):
         seen: set = set()
         results: List[Dict[str, Any]] = []
         for entry in candidates:
-            fp = f"{entry['seller']}|{entry['price']}"
-            if fp in seen:
+            fingerprint = (entry["seller"].casefold(), entry["price"])
+            if fingerprint in seen:
                 continue
-            seen.add(fp)
+            seen.add(fingerprint)
             results.append(entry)
 
-        results.sort(
-            key=lambda e: (e["price"] is None, e["price"] if e["price"] is not None else float("inf"))
-        )
+        _sort_offers_by_price(results)
         return results
 
     def _walk_json(self, node: Any, out: List[Dict], depth: int) -> None:
-        if depth > 15:
-            return
-        if isinstance(node, list):
-            # Check if this list looks like a price-comparison array
-            parsed = [self._try_parse_price_node(item) for item in node]
-            valid = [p for p in parsed if p is not None]
-            if len(valid) >= 2:           # need at least 2 merchants to count
-                out.extend(valid)
-                return                    # don't recurse further inside
-            for item in node:
-                self._walk_json(item, out, depth + 1)
-        elif isinstance(node, dict):
-            for value in node.values():
-                self._walk_json(value, out, depth + 1)
+        # Explicit-stack DFS, same frame-per-node rationale and preorder as
+        # _walk_json_for_links.
+        stack: Deque[Tuple[Any, int]] = deque([(node, depth)])
+        while stack:
+            current, current_depth = stack.pop()
+            if current_depth > _JSON_WALK_MAX_DEPTH:
+                continue
+            if isinstance(current, list):
+                # Peek at the head before sweeping: only lists whose first
+                # dict carries a price-ish key can be the comparison array.
+                head = current[0] if current else None
+                if isinstance(head, dict) and not head.keys().isdisjoint(_PRICE_KEY_HINTS):
+                    parsed = [self._try_parse_price_node(item) for item in current]
+                    valid = [p for p in parsed if p is not None]
+                    if len(valid) >= 2:   # need at least 2 merchants to count
+                        out.extend(valid)
+                        # The first qualifying array is the comparison table;
+                        # any later match would only duplicate it, so stop.
+                        return
+                stack.extend((item, current_depth + 1) for item in reversed(current))
+            elif isinstance(current, dict):
+                stack.extend(
+                    (value, current_depth + 1)
+                    for value in reversed(list(current.values()))
+                )
 
     def _try_parse_price_node(self, item: Any) -> Optional[Dict[str, Any]]:
         if not isinstance(item, dict):
@@ -488,12 +835,7 @@ class MarketplaceScraper(BaseScraper):
             if raw_link.startswith("http"):
                 resolved_pos = pos or SELLER_POS_MAP.get(seller.lower().strip())
                 if resolved_pos:
-                    link = (
-                        f"https://tracking.buyhatke.com/Navigation/"
-                        f"?pos={resolved_pos}&source=price-tracker"
-                        f"&ext1=product_deal_card&ext2="
-                        f"&link={quote(raw_link, safe='')}"
-                    )
+                    link = _tracking_link(resolved_pos, raw_link)
                 else:
                     link = raw_link
 
@@ -504,7 +846,7 @@ class MarketplaceScraper(BaseScraper):
         )
         logo = self._resolve_logo_url(raw_logo, seller)
 
-        price_display = f"₹{int(price_val):,}" if price_val == int(price_val) else f"₹{price_val:,.2f}"
+        price_display = _format_price_display(price_val)
 
         return {
             "seller": seller,
@@ -519,16 +861,9 @@ class MarketplaceScraper(BaseScraper):
     def _extract_from_html(
         self, soup: BeautifulSoup, tracker_url: str
     ) -> List[Dict[str, Any]]:
-        container = None
-        section = soup.find("section", class_="grid")
-        if section:
-            container = section.find("div", class_="overflow-y-auto")
+        container = soup.select_one("section.grid div.overflow-y-auto")
         if not container:
-            for div in soup.find_all("div"):
-                cls = div.get("class") or []
-                if "overflow-y-auto" in cls and "scroll-hide" in cls:
-                    container = div
-                    break
+            container = soup.select_one("div.overflow-y-auto.scroll-hide")
         if not container:
             for div in soup.find_all("div", class_="overflow-y-auto"):
                 if div.find(["button", "li"]):
@@ -550,46 +885,93 @@ class MarketplaceScraper(BaseScraper):
                 continue
             link = self._extract_link_html(item, tracker_url)
             logo = self._resolve_logo_url(self._raw_logo_url(item, tracker_url), seller)
-            fp = f"{seller}|{price_display}"
-            if fp in seen:
+            fingerprint = (seller.casefold(), price_value)
+            if fingerprint in seen:
                 continue
-            seen.add(fp)
+            seen.add(fingerprint)
             results.append({"seller": seller, "price": price_value, "price_display": price_display, "link": link, "logo_url": logo})
 
-        results.sort(key=lambda e: (e["price"] is None, e["price"] if e["price"] is not None else float("inf")))
+        _sort_offers_by_price(results)
         return results
 
-    def _extract_product_id(self, url: str, marketplace: str) -> Optional[str]:
-        if marketplace == "amazon":
-            match = re.search(r"/(?:dp|gp/product)/([A-Z0-9]{10})", url)
-            return match.group(1) if match else None
-
-        if marketplace == "flipkart":
-            parsed_url = urlparse(url)
-            query_params = parse_qs(parsed_url.query)
-            pid = query_params.get("pid", [None])[0]
-            if pid:
-                return pid
-            match = re.search(r"pid=([A-Z0-9]+)", url)
-            return match.group(1) if match else None
-
-        return None
-
     def _get_json(self, url: str) -> Dict[str, Any]:
+        with self._cache_lock:
+            cached = self._json_cache.get(url)
+        if cached is not None:
+            return cached
         response = self._get_response(url)
         try:
-            return response.json()
+            payload = response.json()
         except ValueError as exc:
             raise ScraperError("Upstream returned invalid JSON") from exc
+        with self._cache_lock:
+            self._json_cache[url] = payload
+        return payload
 
     def _get_response(self, url: str) -> requests.Response:
-        headers = {"User-Agent": self.user_agent}
+        with self._in_flight_lock:
+            existing = self._in_flight.get(url)
+            if existing is None:
+                placeholder: Future = Future()
+                self._in_flight[url] = placeholder
+        if existing is not None:
+            return existing.result()
+        try:
+            response = self._hedged_get(url)
+        except Exception as exc:  # relay the failure to waiting callers
+            placeholder.set_exception(exc)
+            raise
+        else:
+            placeholder.set_result(response)
+            return response
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(url, None)
+
+    def _hedged_get(self, url: str) -> requests.Response:
+        with self._hedge_lock:
+            self._request_count += 1
+        hedge_delay = self._latency.p95()
+        if hedge_delay is None:
+            return self._fetch(url)
+
+        primary = self._hedge_executor.submit(self._fetch, url)
+        try:
+            return primary.result(timeout=hedge_delay)
+        except FutureTimeoutError:
+            pass
+        if not self._take_hedge_token():
+            return primary.result()
+        return self._first_response(primary, self._hedge_executor.submit(self._fetch, url))
+
+    def _take_hedge_token(self) -> bool:
+        with self._hedge_lock:
+            if (self._hedge_count + 1) * _HEDGE_BUDGET_RATIO > self._request_count:
+                return False
+            self._hedge_count += 1
+            return True
+
+    @staticmethod
+    def _first_response(primary: Future, hedge: Future) -> requests.Response:
+        done, pending = wait((primary, hedge), return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        loser = pending.pop() if pending else done.pop()
+        try:
+            response = winner.result()
+        except ScraperError:
+            return loser.result()
+        loser.add_done_callback(_close_abandoned_response)
+        return response
+
+    def _fetch(self, url: str) -> requests.Response:
+        started = time.monotonic()
         try:
-            response = requests.get(url, headers=headers, timeout=self.timeout)
+            response = self._session.get(url, timeout=self.timeout)
         except requests.exceptions.Timeout as exc:
             raise UpstreamTimeoutError("Upstream request timed out") from exc
         except requests.exceptions.RequestException as exc:
             raise ScraperError("Upstream request failed") from exc
+        self._latency.record(time.monotonic() - started)
 
         if response.status_code == 404:
             raise UpstreamNotFoundError("Upstream resource not found")
@@ -610,21 +992,22 @@ class MarketplaceScraper(BaseScraper):
         """Return an absolute, working logo URL: scraped → CDN map → None."""
         if raw_url:
             url = str(raw_url).strip()
-            if url.startswith("//"):
-                url = f"https:{url}"
-            elif url.startswith("/images/"):
-                url = f"https://compare.buyhatke.com{url}"
-            elif url.startswith("/"):
-                url = f"https://buyhatke.com{url}"
+            # Common case first: an already-absolute URL needs no prefix work,
+            # and only leading-slash URLs need the relative-to-absolute
+            # dispatch at all.
             if url.startswith("http"):
                 return url
+            if url and url[0] == "/":
+                for prefix, base in _LOGO_URL_PREFIX_RULES:
+                    if url.startswith(prefix):
+                        return f"{base}{url}"
         # Fall back to known CDN map
         normalized = seller.strip().lower()
         if normalized in SELLER_LOGO_MAP:
             return SELLER_LOGO_MAP[normalized]
-        for key, logo in SELLER_LOGO_MAP.items():
-            if key in normalized:
-                return logo
+        match = _SELLER_LOGO_KEY_RE.search(normalized)
+        if match:
+            return SELLER_LOGO_MAP[match.group(0)]
         return None
 
     # ── HTML helpers ───────────────────────────────────────────────────────────
@@ -638,7 +1021,7 @@ class MarketplaceScraper(BaseScraper):
             alt = (img.get("alt") or "").strip()
             if alt:
                 return alt
-        name_p = item.find("p", class_=re.compile(r"capitalize"))
+        name_p = item.find("p", class_=_CAPITALIZE_CLASS_RE)
         if name_p:
             text = name_p.get_text(strip=True)
             if text:
@@ -649,10 +1032,10 @@ class MarketplaceScraper(BaseScraper):
     def _extract_price_html(item: Any) -> Tuple[Optional[float], str]:
         if not hasattr(item, "find"):
             return None, "N/A"
-        price_p = item.find("p", class_=re.compile(r"font-bold"))
+        price_p = item.find("p", class_=_FONT_BOLD_CLASS_RE)
         if price_p:
             raw = price_p.get_text(strip=True)
-            m = re.search(r"[\d,]+(?:\.\d+)?", raw)
+            m = _NUMBER_RE.search(raw)
             if m:
                 try:
                     val = float(m.group(0).replace(",", ""))
@@ -660,7 +1043,7 @@ class MarketplaceScraper(BaseScraper):
                 except ValueError:
                     pass
         text = item.get_text(" ", strip=True)
-        m = re.search(r"₹\s*([\d,]+(?:\.\d+)?)", text)
+        m = _RUPEE_PRICE_RE.search(text)
         if m:
             try:
                 val = float(m.group(1).replace(",", ""))
@@ -683,7 +1066,7 @@ class MarketplaceScraper(BaseScraper):
                 return urljoin(tracker_url, val)
         onclick = item.get("onclick") if hasattr(item, "get") else None
         if onclick:
-            m = re.search(r"https?://[^'\")\s]+", onclick)
+            m = _ONCLICK_URL_RE.search(onclick)
             if m:
                 return m.group(0)
         return None
@@ -711,17 +1094,49 @@ class MarketplaceScraper(BaseScraper):
 
 
 class PriceComparisonService:
-    def __init__(self, scraper: BaseScraper, logger: logging.Logger) -> None:
+    def __init__(
+        self,
+        scraper: BaseScraper,
+        logger: logging.Logger,
+        cache_enabled: bool = False,
+    ) -> None:
         self.scraper = scraper
         self.logger = logger
+        self._cache_enabled = cache_enabled
+        self._result_cache: TTLCache = TTLCache(
+            maxsize=_SCRAPE_RESULT_CACHE_SIZE, ttl=_SCRAPE_RESULT_TTL_SECONDS
+        )
+        self._result_cache_lock = threading.Lock()
 
     def compare(self, url: str, marketplace: Optional[str] = None) -> Dict[str, Any]:
         self.logger.info(
             "Search started",
             extra={"context": {"url": url, "marketplace": marketplace or "auto-detect"}},
         )
+        cache_key = (
+            (canonicalize_url(url), marketplace or "") if self._cache_enabled else None
+        )
+        if cache_key is not None:
+            with self._result_cache_lock:
+                cached = self._result_cache.get(cache_key)
+            if cached is not None:
+                self._log_search(
+                    url=url,
+                    marketplace=cached.marketplace,
+                    source="cache",
+                    detected_price=cached.price,
+                    status="Success",
+                )
+                self.logger.info(
+                    "Search served from cache",
+                    extra={"context": {"url": url, "marketplace": cached.marketplace}},
+                )
+                return self._build_response(cached)
         try:
             result = self.scraper.scrape(url=url, marketplace=marketplace)
+            if cache_key is not None:
+                with self._result_cache_lock:
+                    self._result_cache[cache_key] = result
             self._log_search(
                 url=url,
                 marketplace=result.marketplace,
@@ -740,19 +1155,7 @@ class PriceComparisonService:
                     }
                 },
             )
-            return {
-                "title": result.title,
-                "price": result.price,
-                "image_url": result.image_url,
-                "thumbnail_images": result.thumbnail_images,
-                "source": result.source,
-                "marketplace": result.marketplace,
-                "tracker_url": result.tracker_url,
-                "alternatives": result.alternatives,
-                "alternatives_count": len(result.alternatives),
-                "status": "Success",
-                "error": None,
-            }
+            return self._build_response(result)
         except ScraperError as exc:
             resolved_marketplace = marketplace or detect_marketplace(url) or "unknown"
             self._log_search(
@@ -775,6 +1178,24 @@ class PriceComparisonService:
             )
             raise
 
+    @staticmethod
+    def _build_response(result: ScrapeResult) -> Dict[str, Any]:
+        """Response dict for a scrape result. Built per call — routes decorate
+        the dict in place, so cached ScrapeResults must never share one."""
+        return {
+            "title": result.title,
+            "price": result.price,
+            "image_url": result.image_url,
+            "thumbnail_images": result.thumbnail_images,
+            "source": result.source,
+            "marketplace": result.marketplace,
+            "tracker_url": result.tracker_url,
+            "alternatives": result.alternatives,
+            "alternatives_count": len(result.alternatives),
+            "status": "Success",
+            "error": None,
+        }
+
     def _log_search(
         self,
         url: str,
@@ -784,13 +1205,18 @@ class PriceComparisonService:
         status: str,
         error_message: Optional[str] = None,
     ) -> None:
-        record = SearchHistory(
-            url=url,
-            marketplace=marketplace,
-            source=source,
-            detected_price=detected_price,
-            status=status,
-            error_message=error_message,
+        accepted = enqueue_search(
+            {
+                "url": url,
+                "marketplace": marketplace,
+                "source": source,
+                "detected_price": detected_price,
+                "status": status,
+                "error_message": error_message,
+            }
         )
-        db.session.add(record)
-        db.session.commit()
+        if not accepted:
+            self.logger.warning(
+                "History queue full; dropping record",
+                extra={"context": {"url": url, "status": status}},
+            )
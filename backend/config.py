@@ -5,6 +5,14 @@ class BaseConfig:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///pricepulse.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLAlchemy serializes access per pooled connection already; sqlite3's
+    # own same-thread check only prevents the pool from handing connections
+    # across request threads, so drop it for sqlite URIs.
+    SQLALCHEMY_ENGINE_OPTIONS = (
+        {"connect_args": {"check_same_thread": False}}
+        if SQLALCHEMY_DATABASE_URI.startswith("sqlite")
+        else {}
+    )
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "15"))
     USER_AGENT = os.getenv(
@@ -13,16 +21,26 @@ class BaseConfig:
         "AppleWebKit/537.36 (KHTML, like Gecko) "
         "Chrome/120.0.0.0 Safari/537.36",
     )
+    # Production schema management belongs to migrations; only dev/test
+    # app factories create tables implicitly (or use `flask init-db`).
+    AUTO_CREATE_TABLES = False
+    # Short-TTL result cache in front of the scraper; repeat compares for
+    # the same product skip upstream entirely. Off in tests so mocked
+    # scrapes stay observable per call.
+    SCRAPE_CACHE_ENABLED = True
 
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
+    AUTO_CREATE_TABLES = True
 
 
 class TestingConfig(BaseConfig):
     TESTING = True
+    AUTO_CREATE_TABLES = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     WTF_CSRF_ENABLED = False
+    SCRAPE_CACHE_ENABLED = False
 
 
 class ProductionConfig(BaseConfig):
@@ -10,7 +10,9 @@ if __name__ == "__main__":
         port=5000,
         debug=True,
         use_reloader=True,
-        reloader_type="stat",
+        # Event-driven (inotify/FSEvents) instead of stat-polling every
+        # tracked file per tick; requires the watchdog package.
+        reloader_type="watchdog",
         extra_files=[],
         exclude_patterns=[os.path.join(os.path.expanduser("~"), "AppData")],
     )
@@ -1,24 +1,45 @@
+from datetime import datetime, timedelta
+
 import pytest
 
 from app import create_app, db
+from app.history_writer import flush_history
 from app.models import SearchHistory
+import logging
+
 from app.services import (
     BotDetectionError,
+    MarketplaceScraper,
+    PriceComparisonService,
     ScrapeResult,
     UpstreamNotFoundError,
     UpstreamTimeoutError,
 )
 
 
-@pytest.fixture()
+# One app (and one schema build) for the whole session; per-test isolation
+# comes from _reset_database below. The classic connection-level SAVEPOINT
+# pattern doesn't compose with Flask-SQLAlchemy's context-scoped sessions,
+# so isolation is a cheap per-test row cleanup instead of DDL per test.
+@pytest.fixture(scope="session")
 def app_instance():
     app = create_app("config.TestingConfig")
     with app.app_context():
         db.drop_all()
         db.create_all()
-        yield app
+    yield app
+
+
+@pytest.fixture(autouse=True)
+def _reset_database(app_instance):
+    yield
+    with app_instance.app_context():
+        # Drain anything a test queued but never flushed, so no history rows
+        # leak into the next test's database state.
+        flush_history()
+        db.session.execute(db.delete(SearchHistory))
+        db.session.commit()
         db.session.remove()
-        db.drop_all()
 
 
 @pytest.fixture()
@@ -60,6 +81,26 @@ def test_compare_rejects_extra_fields(client):
     assert response.get_json()["error"] == "Validation failed"
 
 
+def test_compare_rejects_oversized_body(client):
+    """Bodies over the 4 KiB cap must be rejected from the headers alone."""
+    oversized_payload = b'{"url": "' + b"a" * 5000 + b'"}'
+    response = client.post(
+        "/api/v1/compare", data=oversized_payload, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Validation failed"
+
+
+def test_compare_rejects_non_json_content_type(client):
+    response = client.post(
+        "/api/v1/compare",
+        data="url=https://www.amazon.in/dp/B0ABCDE123",
+        content_type="text/plain",
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Validation failed"
+
+
 # ── Success path ──────────────────────────────────────────────────────────────
 
 def test_compare_success_returns_valid_contract(client, mocker):
@@ -128,6 +169,7 @@ def test_compare_timeout_returns_503_and_logs_failure(client, app_instance, mock
     assert body["error"] == "Upstream request timed out"
 
     with app_instance.app_context():
+        flush_history()
         rows = SearchHistory.query.all()
         assert len(rows) == 1
         assert rows[0].status == "Failed"
@@ -154,12 +196,50 @@ def test_compare_logs_success(client, app_instance, mocker):
     assert response.status_code == 200
 
     with app_instance.app_context():
+        flush_history()
         rows = SearchHistory.query.all()
         assert len(rows) == 1
         assert rows[0].status == "Success"
         assert rows[0].detected_price == 999.0
 
 
+# ── Scrape result cache ────────────────────────────────────────────────────────
+
+def test_compare_serves_canonical_url_variants_from_cache(app_instance, mocker):
+    """With the cache on, two URL variants of one product must hit upstream
+    once; the second compare returns the cached result and still writes a
+    history row marked source=cache."""
+    scraper = mocker.Mock()
+    scraper.scrape.return_value = ScrapeResult(
+        title="Cached Product",
+        price=1299.0,
+        image_url=None,
+        thumbnail_images=[],
+        source="buyhatke",
+        marketplace="amazon",
+        tracker_url=None,
+        alternatives=[],
+    )
+    service = PriceComparisonService(
+        scraper=scraper, logger=app_instance.logger, cache_enabled=True
+    )
+
+    first = service.compare("https://www.amazon.in/dp/B0ABCDE123?ref=sr&utm_source=x")
+    second = service.compare("https://www.amazon.in/Some-Name/dp/B0ABCDE123")
+
+    assert scraper.scrape.call_count == 1
+    assert second["status"] == "Success"
+    assert second["price"] == first["price"] == 1299.0
+
+    with app_instance.app_context():
+        flush_history()
+        rows = SearchHistory.query.order_by(SearchHistory.id).all()
+        assert len(rows) == 2
+        assert rows[0].source == "buyhatke"
+        assert rows[1].source == "cache"
+        assert rows[1].detected_price == 1299.0
+
+
 # ── Upstream failure paths ─────────────────────────────────────────────────────
 
 def test_compare_bot_detection_returns_503(client, mocker):
@@ -191,6 +271,41 @@ def test_compare_not_found_returns_404(client, mocker):
     assert body["status"] == "Failed"
 
 
+# ── Scraper parsing: __NEXT_DATA__ link extraction ─────────────────────────────
+
+def test_parse_alternatives_enriches_links_from_next_data():
+    """Sellers scraped from HTML without a link must get their buy URL from
+    the __NEXT_DATA__ link map. Regression: BS4 hands the script body over
+    as a NavigableString (a str subclass), which orjson rejects — the broad
+    except then silently returned an empty map and every link degraded to
+    the tracker-URL fallback."""
+    page = (
+        b"<html><body>"
+        b'<section class="grid"><div class="overflow-y-auto"><button>'
+        b'<img alt="Croma" src="/images/site_icons_m/croma.png"/>'
+        b'<p class="font-bold">\xe2\x82\xb9 1,299</p>'
+        b"</button></div></section>"
+        b'<script id="__NEXT_DATA__">{"props":{"deals":[{"site_name":"Croma",'
+        b'"url":"https://www.croma.com/product/1","site_pos":8704}]}}</script>'
+        b"</body></html>"
+    )
+
+    class FakeResponse:
+        content = page
+
+    scraper = MarketplaceScraper(config={}, logger=logging.getLogger("test"))
+    results = scraper._parse_alternatives(
+        FakeResponse(), "https://buyhatke.com/croma-product-price-in-india-8704-1"
+    )
+
+    assert len(results) == 1
+    assert results[0]["seller"] == "Croma"
+    assert results[0]["link"].startswith(
+        "https://tracking.buyhatke.com/Navigation/?pos=8704"
+    )
+    assert "croma.com" in results[0]["link"]
+
+
 # ── Observability: history endpoint ────────────────────────────────────────────
 
 def test_history_returns_empty_list_initially(client):
@@ -200,6 +315,88 @@ def test_history_returns_empty_list_initially(client):
     assert response.get_json() == []
 
 
+def _seed_history_rows(app_instance, timestamps):
+    """Insert one Success row per timestamp and return them newest-first."""
+    with app_instance.app_context():
+        rows = [
+            SearchHistory(
+                url=f"https://www.amazon.in/dp/B0SEEDED{index:02d}",
+                marketplace="amazon",
+                source="buyhatke",
+                detected_price=float(index),
+                status="Success",
+                timestamp=timestamp,
+            )
+            for index, timestamp in enumerate(timestamps)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [
+            {"id": row.id, "url": row.url, "timestamp": row.timestamp}
+            for row in sorted(rows, key=lambda row: (row.timestamp, row.id), reverse=True)
+        ]
+
+
+def test_history_pagination_walks_pages_with_cursor(client, app_instance):
+    """Two limit=2 pages chained via before/before_id must cover all rows
+    newest-first without overlap."""
+    base = datetime(2026, 8, 30, 12, 0, 0)
+    seeded = _seed_history_rows(
+        app_instance, [base + timedelta(minutes=index) for index in range(4)]
+    )
+
+    page_one = client.get("/api/v1/history?limit=2").get_json()
+    assert [row["url"] for row in page_one] == [seeded[0]["url"], seeded[1]["url"]]
+
+    cursor = page_one[-1]
+    page_two = client.get(
+        f"/api/v1/history?limit=2&before={cursor['timestamp']}&before_id={cursor['id']}"
+    ).get_json()
+    assert [row["url"] for row in page_two] == [seeded[2]["url"], seeded[3]["url"]]
+
+
+def test_history_pagination_keeps_rows_sharing_a_timestamp(client, app_instance):
+    """Rows with identical timestamps must not be skipped across pages —
+    the id tiebreaker carries the cursor through the collision."""
+    shared_timestamp = datetime(2026, 8, 30, 12, 0, 0)
+    seeded = _seed_history_rows(app_instance, [shared_timestamp] * 3)
+
+    page_one = client.get("/api/v1/history?limit=2").get_json()
+    cursor = page_one[-1]
+    page_two = client.get(
+        f"/api/v1/history?limit=2&before={cursor['timestamp']}&before_id={cursor['id']}"
+    ).get_json()
+
+    seen_ids = [row["id"] for row in page_one + page_two]
+    assert sorted(seen_ids) == sorted(row["id"] for row in seeded)
+
+
+def test_history_clamps_limit_to_valid_range(client, app_instance):
+    base = datetime(2026, 8, 30, 12, 0, 0)
+    _seed_history_rows(
+        app_instance, [base + timedelta(minutes=index) for index in range(3)]
+    )
+    response = client.get("/api/v1/history?limit=0")
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
+
+
+def test_history_rejects_non_integer_limit(client):
+    response = client.get("/api/v1/history?limit=abc")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Validation failed"
+
+
+def test_history_rejects_malformed_before_cursor(client):
+    response = client.get("/api/v1/history?before=not-a-timestamp")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Validation failed"
+
+    response = client.get("/api/v1/history?before=2026-08-30T12:00:00&before_id=abc")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Validation failed"
+
+
 def test_history_records_appear_after_search(client, app_instance, mocker):
     """A completed comparison must be visible in the history endpoint."""
     mocker.patch(
@@ -220,6 +417,8 @@ def test_history_records_appear_after_search(client, app_instance, mocker):
         "/api/v1/compare",
         json={"url": "https://www.amazon.in/dp/B0HISTORY1"},
     )
+    with app_instance.app_context():
+        flush_history()
 
     response = client.get("/api/v1/history")
     assert response.status_code == 200